@@ -1,15 +1,10 @@
 import streamlit as st
-import pandas as pd
 import numpy as np
 import folium
 from streamlit_folium import st_folium
 import plotly.graph_objects as go
-from geopy.geocoders import Nominatim
 import math
-from fpdf import FPDF
-from PIL import Image
-import io
-import requests
+from typing import NamedTuple
 
 # -----------------------------------------------------------------------------
 # 1. DATASET (Moved to top to prevent NameError)
@@ -22,11 +17,30 @@ CROP_DB = {
     "Jasmine": {"in": 500, "tn": 850, "yield": 32, "dur": "Daily (6m Peak)", "fert": "Groundnut Cake, Vermicompost", "mandi": "Madurai Flower Market", "soil": "Red Loamy Soil"}
 }
 
+@st.cache_data(show_spinner=False)
+def _crop_arrays():
+    # CROP_DB is static: extract names and [TN, India] revenue per acre once per process
+    table = np.array([(v["tn"], v["in"], v["yield"]) for v in CROP_DB.values()], dtype=np.float64)
+    return tuple(CROP_DB.keys()), table[:, :2] * table[:, 2:]
+
 # -----------------------------------------------------------------------------
 # 2. PAGE SETUP & MULTI-LANGUAGE ENGINE
 # -----------------------------------------------------------------------------
 st.set_page_config(page_title="TN Agri-Oracle Master v17.1", layout="wide", initial_sidebar_state="collapsed")
 
+CROP_NAMES, CROP_REV_PER_ACRE = _crop_arrays()
+
+# 5-year regional trend: fixed +/-7.5% steps around the current TN value
+HISTORY_YEARS = ('2020', '2021', '2022', '2023', '2024')
+HISTORY_GROWTH = (1 + 0.075 * np.arange(-2, 3)).astype(np.float32)
+
+# Only the plotly_dark colours we actually use, instead of shipping the whole template with each figure
+CHART_TEMPLATE = go.layout.Template(layout=dict(
+    font=dict(color="#f2f5fa"),
+    xaxis=dict(gridcolor="#283442", zerolinecolor="#283442"),
+    yaxis=dict(gridcolor="#283442", zerolinecolor="#283442"),
+))
+
 if 'lang' not in st.session_state:
     st.session_state.lang = 'en'
 
@@ -55,36 +69,41 @@ L = T[st.session_state.lang]
 # -----------------------------------------------------------------------------
 # 3. UI CSS (TEA PLANTATION THEME)
 # -----------------------------------------------------------------------------
-st.markdown(f"""
+APP_CSS = """
     <style>
-    .stApp {{
+    .stApp {
         background: linear-gradient(rgba(0,0,0,0.7), rgba(0,0,0,0.7)), 
                     url('https://as2.ftcdn.net/v2/jpg/05/44/22/16/1000_F_544221648_hY0Bf0UfH1N9XlWfFjB9YpG7n9V6uJzF.jpg');
         background-size: cover; background-attachment: fixed;
-    }}
-    input[type=number]::-webkit-inner-spin-button, input[type=number]::-webkit-outer-spin-button {{ 
+    }
+    input[type=number]::-webkit-inner-spin-button, input[type=number]::-webkit-outer-spin-button { 
         -webkit-appearance: none; margin: 0; 
-    }}
-    .glass-panel {{
+    }
+    .glass-panel {
         background: rgba(0, 20, 0, 0.92); border: 2px solid #00ff88;
         border-radius: 12px; padding: 25px; color: white; margin-bottom: 20px;
         box-shadow: 0 8px 32px 0 rgba(0, 0, 0, 0.8);
-    }}
-    .worth-val {{ color: #ffcc00; font-size: 1.8rem; font-weight: bold; }}
-    .label-hint {{ color: #00ff88; font-size: 0.85rem; font-weight: bold; }}
-    [data-testid="stSidebar"] {{ display: none; }}
-    .main .block-container {{ padding: 1rem 3rem; max-width: 100%; }}
+    }
+    .worth-val { color: #ffcc00; font-size: 1.8rem; font-weight: bold; }
+    .label-hint { color: #00ff88; font-size: 0.85rem; font-weight: bold; }
+    [data-testid="stSidebar"] { display: none; }
+    .main .block-container { padding: 1rem 3rem; max-width: 100%; }
     </style>
-""", unsafe_allow_html=True)
+"""
+st.markdown(APP_CSS, unsafe_allow_html=True)
 
 # -----------------------------------------------------------------------------
 # 4. HELPER LOGIC
 # -----------------------------------------------------------------------------
+@st.cache_resource(show_spinner=False)
+def get_geocoder():
+    from geopy.geocoders import Nominatim  # only paid on the first geocode cache miss
+    return Nominatim(user_agent="tn_agri_master_final", timeout=15)
+
 @st.cache_data(show_spinner=False)
 def fetch_geo(lat, lon):
     try:
-        geolocator = Nominatim(user_agent="tn_agri_master_final")
-        location = geolocator.reverse((lat, lon), timeout=15)
+        location = get_geocoder().reverse((lat, lon))
         if location:
             a = location.raw.get('address', {})
             village = a.get('village') or a.get('suburb') or a.get('town') or a.get('hamlet') or "Agri Zone"
@@ -94,14 +113,95 @@ def fetch_geo(lat, lon):
     except: pass
     return "Rural Farm Area", "District Center", "Tamil Nadu"
 
+def farm_worth(crop, acres):
+    # [TN, India] net worth; plain arithmetic, cheaper than hashing a cache key
+    tn_w, in_w = (CROP_REV_PER_ACRE[CROP_NAMES.index(crop)] * acres).tolist()
+    return tn_w, in_w
+
+SQM_PER_ACRE = 4047     # 1 acre ~ 4047 m²
+M_PER_DEG_LAT = 111320  # 1 degree lat is approx 111,320 meters
+
+def plot_side(acres):
+    # Side of the square plot in meters
+    return math.sqrt(acres * SQM_PER_ACRE)
+
 def get_borders(lat, lon, acres):
-    side = math.sqrt(acres * 4047)
-    # 1 degree lat is approx 111,320 meters
-    d_lat = (side / 111320) / 2
+    side = plot_side(acres)
+    d_lat = (side / M_PER_DEG_LAT) / 2
     # 1 degree lon depends on the latitude
-    d_lon = (side / (111320 * math.cos(math.radians(lat)))) / 2
+    d_lon = (side / (M_PER_DEG_LAT * math.cos(math.radians(lat)))) / 2
     return [[lat+d_lat, lon-d_lon], [lat+d_lat, lon+d_lon], [lat-d_lat, lon+d_lon], [lat-d_lat, lon-d_lon], [lat+d_lat, lon-d_lon]]
 
+SATELLITE_TILES = 'https://mt1.google.com/vt/lyrs=y&x={x}&y={y}&z={z}'
+
+# Built fresh each run: st_folium renders (and rewrites ids on) the map it is given,
+# so a live folium.Map must not be shared across sessions via st.cache_resource
+def build_base_map(lat, lon, zoom=18):
+    m = folium.Map(location=[lat, lon], zoom_start=zoom)
+    folium.TileLayer(tiles=SATELLITE_TILES, attr='Google', name='Satellite').add_to(m)
+    return m
+
+def build_boundary_layer(lat, lon, acres):
+    # Handed to st_folium separately so boundary edits update the layer without reloading the base map
+    layer = folium.FeatureGroup(name='Farm Boundary')
+    folium.Polygon(locations=get_borders(lat, lon, acres), color="#00ff88", weight=5, fill=True, fill_opacity=0.3).add_to(layer)
+    return layer
+
+# cache_resource hands back the stored figure as-is; cache_data would unpickle it through
+# go.Figure(props) and re-run validation on every hit. The figure is never mutated after this.
+@st.cache_resource(show_spinner=False, max_entries=32)
+def build_history_fig(tn_w):
+    # float32 (from HISTORY_GROWTH) is plenty for a chart and halves the trace payload
+    h_vals = tn_w * HISTORY_GROWTH
+    return go.Figure(
+        go.Scatter(x=HISTORY_YEARS, y=h_vals, mode='lines+markers+text', text=[f"₹{x/1000:.0f}k" for x in h_vals], line=dict(color='#00ff88', width=4)),
+        layout=dict(template=CHART_TEMPLATE, paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', height=280, margin=dict(l=10,r=10,t=30,b=10)),
+    )
+
+LEAF_TYPES = ('jpg', 'png')
+
+@st.fragment
+def leaf_doctor():
+    # Uploads only rerun this section, not the map, charts and geocoder
+    st.subheader(L['leaf'])
+    leaf_file = st.file_uploader("Scan Leaf", type=LEAF_TYPES, label_visibility="collapsed")
+    if leaf_file: st.success("AI Result: Healthy Leaf. No infection detected.")
+    else: st.write("Waiting for upload... Section active.")
+
+class FarmReport(NamedTuple):
+    # Everything the PDF report shows; one immutable tuple doubles as its cache key
+    village: str
+    city: str
+    crop: str
+    acres: float
+    tn_worth: float
+    in_worth: float
+    fert: str
+
+# Keyed on float acreage/worths and shared by all sessions, so keep only recent reports
+@st.cache_data(show_spinner=False, max_entries=32)
+def build_report_pdf(report):
+    from fpdf import FPDF  # only needed once a report is requested
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("Arial", 'B', 16)
+    pdf.cell(200, 10, "Farm Digital Health Report", 0, 1, 'C')
+    pdf.set_font("Arial", size=12)
+    pdf.ln(10)
+    pdf.cell(200, 10, f"Location: {report.village}, {report.city}", 0, 1)
+    pdf.cell(200, 10, f"Crop: {report.crop} | Acres: {report.acres}", 0, 1)
+    pdf.cell(200, 10, f"TN Market Value: INR {report.tn_worth:,.2f}", 0, 1)
+    pdf.cell(200, 10, f"India Market Value: INR {report.in_worth:,.2f}", 0, 1)
+    pdf.cell(200, 10, f"Fertilizer: {report.fert}", 0, 1)
+    return pdf.output(dest='S').encode('latin-1')
+
+@st.fragment
+def report_panel(report):
+    # Generate/download clicks only rerun this panel, not the map and charts
+    if st.button(f"📥 {L['pdf']}"):
+        report_bytes = build_report_pdf(report)
+        st.download_button("Download Official PDF Report", report_bytes, "AgriFarmReport.pdf", "application/pdf")
+
 # -----------------------------------------------------------------------------
 # 5. UI - TOP HEADER
 # -----------------------------------------------------------------------------
@@ -114,8 +214,8 @@ with c_btns:
             st.session_state.lang = 'ta' if st.session_state.lang == 'en' else 'en'
             st.rerun()
     with col_p:
-        # PDF Generation Logic integrated here
-        pdf_trigger = st.button(f"📥 {L['pdf']}")
+        # PDF Generation Logic integrated here (filled in by report_panel below)
+        report_slot = st.container()
 
 # -----------------------------------------------------------------------------
 # 6. ROW 1: INPUTS (NO EMPTY BOXES)
@@ -133,25 +233,25 @@ with i3:
     acres_in = st.number_input("ac", value=1.0, format="%.2f", label_visibility="collapsed")
 with i4:
     st.markdown(f"<p class='label-hint'>{L['crop']}</p>", unsafe_allow_html=True)
-    sel_crop = st.selectbox("cp", list(CROP_DB.keys()), label_visibility="collapsed")
+    sel_crop = st.selectbox("cp", CROP_NAMES, label_visibility="collapsed")
 st.markdown('</div>', unsafe_allow_html=True)
 
 # -----------------------------------------------------------------------------
 # 7. ROW 2: MAP & WEATHER
 # -----------------------------------------------------------------------------
+# Quantize to ~10m so tiny input nudges keep the same base-map key and geocode cache entry
+lat_q, lon_q = round(lat_in, 4), round(lon_in, 4)
 col_m, col_w = st.columns([2.5, 1])
 with col_m:
     st.markdown('<div class="glass-panel">', unsafe_allow_html=True)
-    m = folium.Map(location=[lat_in, lon_in], zoom_start=18)
-    folium.TileLayer(tiles='https://mt1.google.com/vt/lyrs=y&x={x}&y={y}&z={z}', attr='Google', name='Satellite').add_to(m)
-    b_coords = get_borders(lat_in, lon_in, acres_in)
-    folium.Polygon(locations=b_coords, color="#00ff88", weight=5, fill=True, fill_opacity=0.3).add_to(m)
-    st_folium(m, width="100%", height=400)
+    # Nothing is read back from the map, so panning/zooming needn't rerun the script
+    st_folium(build_base_map(lat_q, lon_q), width="100%", height=400, key="farm_map", returned_objects=[],
+              feature_group_to_add=build_boundary_layer(lat_in, lon_in, acres_in))
     st.markdown('</div>', unsafe_allow_html=True)
 
 with col_w:
     st.markdown('<div class="glass-panel">', unsafe_allow_html=True)
-    vil, cit, sta = fetch_geo(lat_in, lon_in)
+    vil, cit, sta = fetch_geo(lat_q, lon_q)
     st.subheader(f"📍 {vil}")
     st.write(f"**{L['city']}:** {cit}")
     st.write(f"**{L['weather']}:** 31°C | Sunny")
@@ -188,25 +288,23 @@ st.markdown('</div>', unsafe_allow_html=True)
 # -----------------------------------------------------------------------------
 f_l, f_r = st.columns([1.2, 2])
 c_data = CROP_DB[sel_crop]
-tn_w = acres_in * c_data['yield'] * c_data['tn']
-in_w = acres_in * c_data['yield'] * c_data['in']
+tn_w, in_w = farm_worth(sel_crop, acres_in)
 
 with f_l:
     st.markdown('<div class="glass-panel">', unsafe_allow_html=True)
-    st.subheader(L['worth'])
-    st.markdown(f"{L['tn']}: <br><span class='worth-val'>₹{tn_w:,.2f}</span>", unsafe_allow_html=True)
-    st.markdown(f"{L['in']}: <br><span class='worth-val'>₹{in_w:,.2f}</span>", unsafe_allow_html=True)
-    st.write(f"**{L['dur']}:** {c_data['dur']}")
+    st.markdown(
+        f"### {L['worth']}\n\n"
+        f"{L['tn']}: <br><span class='worth-val'>₹{tn_w:,.2f}</span>\n\n"
+        f"{L['in']}: <br><span class='worth-val'>₹{in_w:,.2f}</span>\n\n"
+        f"**{L['dur']}:** {c_data['dur']}",
+        unsafe_allow_html=True,
+    )
     st.markdown('</div>', unsafe_allow_html=True)
 
 with f_r:
     st.markdown('<div class="glass-panel">', unsafe_allow_html=True)
     st.subheader(L['history'])
-    yrs = ['2020', '2021', '2022', '2023', '2024']
-    h_vals = [tn_w * (1 + (i*0.075)) for i in range(-2, 3)]
-    fig = go.Figure(go.Scatter(x=yrs, y=h_vals, mode='lines+markers+text', text=[f"₹{x/1000:.0f}k" for x in h_vals], line=dict(color='#00ff88', width=4)))
-    fig.update_layout(template="plotly_dark", paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', height=280, margin=dict(l=10,r=10,t=30,b=10))
-    st.plotly_chart(fig, use_container_width=True)
+    st.plotly_chart(build_history_fig(tn_w), use_container_width=True)
     st.markdown('</div>', unsafe_allow_html=True)
 
 # -----------------------------------------------------------------------------
@@ -215,37 +313,24 @@ with f_r:
 t_l, t_r = st.columns(2)
 with t_l:
     st.markdown('<div class="glass-panel">', unsafe_allow_html=True)
-    st.subheader(L['leaf'])
-    leaf_file = st.file_uploader("Scan Leaf", type=['jpg','png'], label_visibility="collapsed")
-    if leaf_file: st.success("AI Result: Healthy Leaf. No infection detected.")
-    else: st.write("Waiting for upload... Section active.")
+    leaf_doctor()
     st.markdown('</div>', unsafe_allow_html=True)
 
 with t_r:
     st.markdown('<div class="glass-panel">', unsafe_allow_html=True)
     st.subheader(L['suggest'])
-    st.markdown(f"- **உரம் (Fertilizer):** {c_data['fert']}")
-    st.markdown(f"- **மண் (Soil):** Your land shows **{c_data['soil']}** characteristics. pH {u_ph} is ideal.")
-    st.markdown(f"- **நீர் (Water):** Drip irrigation detected for {acres_in} acres.")
-    st.markdown(f"- **பாதுகாப்பு (Safety):** Fencing perimeter: {math.sqrt(acres_in*4047)*4:.0f}m.")
+    st.markdown("\n".join([
+        f"- **உரம் (Fertilizer):** {c_data['fert']}",
+        f"- **மண் (Soil):** Your land shows **{c_data['soil']}** characteristics. pH {u_ph} is ideal.",
+        f"- **நீர் (Water):** Drip irrigation detected for {acres_in} acres.",
+        f"- **பாதுகாப்பு (Safety):** Fencing perimeter: {plot_side(acres_in)*4:.0f}m.",
+    ]))
     st.markdown('</div>', unsafe_allow_html=True)
 
 # -----------------------------------------------------------------------------
 # 11. PDF GENERATOR
 # -----------------------------------------------------------------------------
-if pdf_trigger:
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", 'B', 16)
-    pdf.cell(200, 10, "Farm Digital Health Report", 0, 1, 'C')
-    pdf.set_font("Arial", size=12)
-    pdf.ln(10)
-    pdf.cell(200, 10, f"Location: {vil}, {cit}", 0, 1)
-    pdf.cell(200, 10, f"Crop: {sel_crop} | Acres: {acres_in}", 0, 1)
-    pdf.cell(200, 10, f"TN Market Value: INR {tn_w:,.2f}", 0, 1)
-    pdf.cell(200, 10, f"India Market Value: INR {in_w:,.2f}", 0, 1)
-    pdf.cell(200, 10, f"Fertilizer: {c_data['fert']}", 0, 1)
-    report_bytes = pdf.output(dest='S').encode('latin-1')
-    st.download_button("Download Official PDF Report", report_bytes, "AgriFarmReport.pdf", "application/pdf")
+with report_slot:
+    report_panel(FarmReport(vil, cit, sel_crop, acres_in, tn_w, in_w, c_data['fert']))
 
 st.markdown("<center style='opacity:0.5; color:white;'>Agri-Satellite Pro Master v17.1 | Fullscreen Intelligence</center>", unsafe_allow_html=True)